@@ -1,30 +1,93 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from fastapi.middleware.gzip import GZipMiddleware
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from cachetools import TTLCache
+from aiodataloader import DataLoader
+import asyncio
 import os
+import atexit
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Optional
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 import base64
+import binascii
+
+# Configure logging before anything else runs. Records are handed to a queue and
+# written by a listener thread, so logging never blocks the event loop on I/O.
+# The listener lives as long as the process, not an app lifespan, so records
+# logged between or after lifespans are still written.
+_log_queue = queue.Queue(-1)
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+_log_listener = QueueListener(_log_queue, _log_handler, respect_handler_level=True)
+# The listener's handler does the real formatting; the queue side only renders the message
+logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[QueueHandler(_log_queue)])
+_log_listener.start()
+
+def stop_log_listener():
+    """Flush queued records and stop the listener; safe to call more than once"""
+    # QueueListener.stop() fails if the listener is already stopped
+    if _log_listener._thread is not None:
+        _log_listener.stop()
+
+atexit.register(stop_log_listener)
+
+logger = logging.getLogger(__name__)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Motor sizes its pymongo thread pool on import, so the default must be set first
+os.environ.setdefault('MOTOR_MAX_WORKERS', '32')
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    maxPoolSize=100,
+    minPoolSize=10,
+    maxIdleTimeMS=30000,
+    serverSelectionTimeoutMS=2000,
+    compressors='zstd,zlib',
+    tz_aware=True,
+)
 db = client[os.environ['DB_NAME']]
 
+# Largest accepted base64 payload for a background image (~7.5 MB decoded)
+MAX_BACKGROUND_B64_LENGTH = 10 * 1024 * 1024
+
+# Raster formats a background may be stored and served as. Anything else (notably
+# image/svg+xml, which can carry script) would be served from the API origin.
+ALLOWED_IMAGE_TYPES = {"image/png", "image/jpeg", "image/webp", "image/gif"}
+
+# Leaderboard snapshot size and how often the background task rebuilds it
+LEADERBOARD_SIZE = 100
+LEADERBOARD_REFRESH_SECONDS = 30
+
+# Leaderboard results keyed by limit; cleared whenever the snapshot is rebuilt
+_lb_cache = TTLCache(maxsize=32, ttl=LEADERBOARD_REFRESH_SECONDS)
+_lb_lock = asyncio.Lock()
+
 # Create the main app without a prefix
-app = FastAPI(title="Burger Drop Game API")
+app = FastAPI(title="Burger Drop Game API", default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+def utcnow():
+    """Timezone-aware replacement for the deprecated datetime.utcnow()"""
+    return datetime.now(timezone.utc)
+
 # Define Models
 class Hazard(BaseModel):
     type: str  # 'knife', 'fire', 'grill'
@@ -54,7 +117,7 @@ class Level(BaseModel):
     target: Target
     hazards: List[Hazard] = []
     obstacles: List[Obstacle] = []
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=utcnow)
 
 class LevelCreate(BaseModel):
     level_number: int
@@ -64,11 +127,11 @@ class LevelCreate(BaseModel):
     hazards: List[Hazard] = []
     obstacles: List[Obstacle] = []
 
-class BackgroundImage(BaseModel):
+class BackgroundImageMeta(BaseModel):
+    """Listing entry; the image itself is served by /backgrounds/{id}/image"""
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
-    image_data: str  # Base64 encoded image
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=utcnow)
 
 class BackgroundImageCreate(BaseModel):
     name: str
@@ -79,9 +142,10 @@ class GameProgress(BaseModel):
     player_id: str
     current_level: int
     completed_levels: List[int] = []
+    completed_count: int = 0
     total_attempts: int = 0
     total_wins: int = 0
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=utcnow)
 
 class GameProgressUpdate(BaseModel):
     current_level: Optional[int] = None
@@ -92,11 +156,39 @@ class GameProgressUpdate(BaseModel):
 class StatusCheck(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     client_name: str
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    timestamp: datetime = Field(default_factory=utcnow)
 
 class StatusCheckCreate(BaseModel):
     client_name: str
 
+async def stream_json_array(cursor, model):
+    """Stream cursor documents as a JSON array, serializing one document at a time.
+
+    Documents were written by this service, so they are constructed without validation.
+    The first document is fetched and serialized before the response starts, so query,
+    connection and serialization failures on it still produce a normal error status.
+    Once the body is streaming, a failure can only be logged and the response aborted.
+    """
+    def serialize(doc):
+        # Constructed models keep nested values as plain dicts; don't warn about it
+        return model.model_construct(**doc).model_dump_json(warnings=False).encode()
+
+    first = await anext(cursor, None)
+    if first is None:
+        return Response(content=b"[]", media_type="application/json")
+    head = b"[" + serialize(first)
+
+    async def body():
+        yield head
+        try:
+            async for doc in cursor:
+                yield b"," + serialize(doc)
+        except Exception:
+            logger.exception("Aborting streamed %s list", model.__name__)
+            raise
+        yield b"]"
+    return StreamingResponse(body(), media_type="application/json")
+
 # Health check
 @api_router.get("/")
 async def root():
@@ -110,23 +202,27 @@ async def health_check():
 @api_router.get("/levels", response_model=List[Level])
 async def get_levels():
     """Get all custom levels"""
-    levels = await db.levels.find().sort("level_number", 1).to_list(100)
-    return [Level(**level) for level in levels]
+    cursor = db.levels.find().sort("level_number", 1).limit(100)
+    return await stream_json_array(cursor, Level)
 
 @api_router.get("/levels/{level_number}", response_model=Level)
 async def get_level(level_number: int):
     """Get a specific level by number"""
-    level = await db.levels.find_one({"level_number": level_number})
+    level = await db.levels.find_one({"level_number": level_number}, {"_id": 0})
     if not level:
         raise HTTPException(status_code=404, detail="Level not found")
-    return Level(**level)
+    return level
 
 @api_router.post("/levels", response_model=Level)
 async def create_level(level_data: LevelCreate):
     """Create a new custom level"""
-    level = Level(**level_data.dict())
-    await db.levels.insert_one(level.dict())
-    return level
+    # dict() is shallow, so the validated Target/Hazard/Obstacle instances are reused
+    level_doc = Level(**dict(level_data)).model_dump()
+    try:
+        await db.levels.insert_one(level_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Level already exists")
+    return level_doc
 
 @api_router.delete("/levels/{level_number}")
 async def delete_level(level_number: int):
@@ -137,31 +233,76 @@ async def delete_level(level_number: int):
     return {"message": "Level deleted successfully"}
 
 # Background image endpoints
-@api_router.get("/backgrounds", response_model=List[BackgroundImage])
+def split_image_data(image_data):
+    """Split a data URL or bare base64 string into (media_type, base64 payload).
+
+    Raises ValueError if the media type is not in ALLOWED_IMAGE_TYPES.
+    """
+    if image_data.startswith('data:image'):
+        header, base64_data = image_data.split(',', 1)
+        media_type = header[len('data:'):].split(';')[0].strip().lower()
+    else:
+        media_type, base64_data = 'image/png', image_data
+    if media_type not in ALLOWED_IMAGE_TYPES:
+        raise ValueError(f"Unsupported image type: {media_type!r}")
+    return media_type, base64_data
+
+@api_router.get("/backgrounds", response_model=List[BackgroundImageMeta])
 async def get_backgrounds():
-    """Get all saved background images"""
-    backgrounds = await db.backgrounds.find().to_list(50)
-    return [BackgroundImage(**bg) for bg in backgrounds]
+    """Get all saved background images (metadata only)"""
+    cursor = db.backgrounds.find({}, {"_id": 0, "id": 1, "name": 1, "created_at": 1}).limit(50)
+    return await stream_json_array(cursor, BackgroundImageMeta)
 
-@api_router.post("/backgrounds", response_model=BackgroundImage)
+@api_router.post("/backgrounds", response_model=BackgroundImageMeta)
 async def save_background(background_data: BackgroundImageCreate):
     """Save a background image (base64 encoded)"""
+    if len(background_data.image_data) > MAX_BACKGROUND_B64_LENGTH:
+        raise HTTPException(status_code=413, detail="Background image too large")
+    
     # Validate base64 data
     try:
         # Check if it's valid base64
-        if background_data.image_data.startswith('data:image'):
-            # Extract base64 part
-            base64_data = background_data.image_data.split(',')[1]
-        else:
-            base64_data = background_data.image_data
-        base64.b64decode(base64_data)
+        media_type, base64_data = split_image_data(background_data.image_data)
+        # Strict base64 is always padded to whole quanta; reject without decoding
+        if len(base64_data) % 4:
+            raise ValueError("Incorrect base64 padding")
+        # The bytes are stored, so this single decode doubles as validation. Multi-MB
+        # payloads would stall the event loop, so it runs in a worker thread, and
+        # a2b_base64 takes the ASCII str directly (b64decode would copy it to bytes first).
+        image_bytes = await asyncio.to_thread(binascii.a2b_base64, base64_data, strict_mode=True)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid base64 image data")
     
-    background = BackgroundImage(**background_data.dict())
-    await db.backgrounds.insert_one(background.dict())
+    background = BackgroundImageMeta(name=background_data.name).model_dump()
+    # Persist the decoded bytes (BSON binary) rather than the ~33% larger base64 text
+    await db.backgrounds.insert_one({**background, "media_type": media_type, "image_bytes": image_bytes})
     return background
 
+@api_router.get("/backgrounds/{background_id}/image")
+async def get_background_image(background_id: str):
+    """Get the raw bytes of a saved background image"""
+    bg = await db.backgrounds.find_one(
+        {"id": background_id},
+        {"_id": 0, "image_bytes": 1, "media_type": 1, "image_data": 1}
+    )
+    if not bg:
+        raise HTTPException(status_code=404, detail="Background not found")
+    if "image_bytes" not in bg:
+        # Saved before images were stored as bytes
+        try:
+            bg["media_type"], base64_data = split_image_data(bg["image_data"])
+        except ValueError:
+            raise HTTPException(status_code=404, detail="Background not found")
+        bg["image_bytes"] = await asyncio.to_thread(base64.b64decode, base64_data)
+    elif bg.get("media_type") not in ALLOWED_IMAGE_TYPES:
+        # Stored before uploads were checked against the allowlist
+        raise HTTPException(status_code=404, detail="Background not found")
+    return Response(
+        content=bg["image_bytes"],
+        media_type=bg["media_type"],
+        headers={"X-Content-Type-Options": "nosniff"}
+    )
+
 @api_router.delete("/backgrounds/{background_id}")
 async def delete_background(background_id: str):
     """Delete a saved background image"""
@@ -171,81 +312,157 @@ async def delete_background(background_id: str):
     return {"message": "Background deleted successfully"}
 
 # Game progress endpoints
+async def _load_progress_batch(player_ids):
+    """Fetch progress for every player_id requested in the same loop tick in one query"""
+    cursor = db.progress.find({"player_id": {"$in": list(set(player_ids))}})
+    docs = {doc["player_id"]: doc async for doc in cursor}
+    return [docs.get(player_id) for player_id in player_ids]
+
+_progress_loader = None
+
+async def get_progress_loader() -> DataLoader:
+    # Shared across requests so concurrent reads coalesce. This must be async so FastAPI
+    # runs it on the event loop rather than in a worker thread; the loader is bound to
+    # the running loop and rebuilt if that loop changes. Caching is off, every load
+    # sees fresh data.
+    global _progress_loader
+    loop = asyncio.get_running_loop()
+    if _progress_loader is None or _progress_loader.loop is not loop:
+        _progress_loader = DataLoader(_load_progress_batch, cache=False, loop=loop)
+    return _progress_loader
+
 @api_router.get("/progress/{player_id}", response_model=GameProgress)
-async def get_progress(player_id: str):
+async def get_progress(player_id: str, loader: DataLoader = Depends(get_progress_loader)):
     """Get player's game progress"""
-    progress = await db.progress.find_one({"player_id": player_id})
+    progress = await loader.load(player_id)
     if not progress:
-        # Create new progress for player
-        new_progress = GameProgress(player_id=player_id, current_level=1)
-        await db.progress.insert_one(new_progress.dict())
-        return new_progress
-    return GameProgress(**progress)
+        # Create new progress for player; upserting keeps concurrent first reads from
+        # inserting twice and returns whichever document won
+        progress = await db.progress.find_one_and_update(
+            {"player_id": player_id},
+            {"$setOnInsert": GameProgress(player_id=player_id, current_level=1).model_dump()},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    return progress
 
 @api_router.put("/progress/{player_id}", response_model=GameProgress)
 async def update_progress(player_id: str, update: GameProgressUpdate):
     """Update player's game progress"""
-    progress = await db.progress.find_one({"player_id": player_id})
-    if not progress:
-        progress = GameProgress(player_id=player_id, current_level=1).dict()
-    
-    update_data = {"updated_at": datetime.utcnow()}
+    now = utcnow()
+    set_fields = {"updated_at": now}
+    inc_fields = {}
+    update_doc = {"$set": set_fields}
     
     if update.current_level is not None:
-        update_data["current_level"] = update.current_level
-    
-    if update.completed_level is not None:
-        completed = progress.get("completed_levels", [])
-        if update.completed_level not in completed:
-            completed.append(update.completed_level)
-        update_data["completed_levels"] = completed
+        set_fields["current_level"] = update.current_level
     
     if update.add_attempt:
-        update_data["total_attempts"] = progress.get("total_attempts", 0) + 1
+        inc_fields["total_attempts"] = 1
     
     if update.add_win:
-        update_data["total_wins"] = progress.get("total_wins", 0) + 1
+        inc_fields["total_wins"] = 1
     
-    await db.progress.update_one(
-        {"player_id": player_id},
-        {"$set": update_data},
-        upsert=True
-    )
+    if inc_fields:
+        update_doc["$inc"] = inc_fields
     
-    updated_progress = await db.progress.find_one({"player_id": player_id})
-    return GameProgress(**updated_progress)
+    # New players start from the model defaults, minus fields the operators above write
+    touched = set(set_fields) | set(inc_fields)
+    defaults = GameProgress(player_id=player_id, current_level=1, updated_at=now).model_dump()
+    update_doc["$setOnInsert"] = {k: v for k, v in defaults.items() if k not in touched}
+    
+    progress = None
+    if update.completed_level is not None:
+        # Only matches while the level is new, so the push and the counter bump stay in step
+        progress = await db.progress.find_one_and_update(
+            {"player_id": player_id, "completed_levels": {"$ne": update.completed_level}},
+            {
+                "$set": set_fields,
+                "$push": {"completed_levels": update.completed_level},
+                "$inc": {**inc_fields, "completed_count": 1},
+            },
+            return_document=ReturnDocument.AFTER
+        )
+        # No match means the level was already completed or the player is new
+        update_doc["$setOnInsert"].update(
+            completed_levels=[update.completed_level], completed_count=1
+        )
+    
+    if progress is None:
+        progress = await db.progress.find_one_and_update(
+            {"player_id": player_id},
+            update_doc,
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        completed_level = update.completed_level
+        if completed_level is not None and completed_level not in progress.get("completed_levels", []):
+            # Another request created the player between the two calls, so the upsert
+            # matched instead of inserting and $setOnInsert never recorded the level.
+            # Everything else is applied; push the level on its own now the document exists.
+            progress = await db.progress.find_one_and_update(
+                {"player_id": player_id, "completed_levels": {"$ne": completed_level}},
+                {
+                    "$push": {"completed_levels": completed_level},
+                    "$inc": {"completed_count": 1},
+                },
+                return_document=ReturnDocument.AFTER
+            )
+            if progress is None:
+                # A concurrent request recorded the same level in the meantime
+                progress = await db.progress.find_one({"player_id": player_id})
+    return progress
 
 # Leaderboard
+async def refresh_leaderboard():
+    """Rebuild the materialized top-players snapshot from progress"""
+    cursor = db.progress.find(
+        {},
+        {"_id": 0, "player_id": 1, "total_wins": 1, "total_attempts": 1, "completed_count": 1}
+    ).sort([("completed_count", -1), ("total_wins", -1)]).limit(LEADERBOARD_SIZE)
+    entries = await cursor.to_list(LEADERBOARD_SIZE)
+    await db.leaderboard_top.replace_one(
+        {"_id": "global"},
+        {"entries": entries, "updated_at": utcnow()},
+        upsert=True
+    )
+    _lb_cache.clear()
+    return entries
+
+async def refresh_leaderboard_loop():
+    while True:
+        try:
+            await refresh_leaderboard()
+        except Exception:
+            logger.exception("Leaderboard refresh failed")
+        await asyncio.sleep(LEADERBOARD_REFRESH_SECONDS)
+
 @api_router.get("/leaderboard")
-async def get_leaderboard(limit: int = 10):
+async def get_leaderboard(limit: int = Query(10, ge=1, le=LEADERBOARD_SIZE)):
     """Get top players by completed levels and wins"""
-    pipeline = [
-        {
-            "$project": {
-                "player_id": 1,
-                "total_wins": 1,
-                "total_attempts": 1,
-                "completed_count": {"$size": {"$ifNull": ["$completed_levels", []]}}
-            }
-        },
-        {"$sort": {"completed_count": -1, "total_wins": -1}},
-        {"$limit": limit}
-    ]
-    results = await db.progress.aggregate(pipeline).to_list(limit)
+    results = _lb_cache.get(limit)
+    if results is not None:
+        return results
+    async with _lb_lock:
+        results = _lb_cache.get(limit)
+        if results is None:
+            snapshot = await db.leaderboard_top.find_one({"_id": "global"})
+            # The snapshot only goes missing before the first refresh completes
+            entries = snapshot["entries"] if snapshot else await refresh_leaderboard()
+            results = entries[:limit]
+            _lb_cache[limit] = results
     return results
 
 # Status check (original endpoint)
 @api_router.post("/status", response_model=StatusCheck)
 async def create_status_check(input: StatusCheckCreate):
-    status_dict = input.dict()
-    status_obj = StatusCheck(**status_dict)
-    await db.status_checks.insert_one(status_obj.dict())
-    return status_obj
+    status_doc = StatusCheck(**dict(input)).model_dump()
+    await db.status_checks.insert_one(status_doc)
+    return status_doc
 
 @api_router.get("/status", response_model=List[StatusCheck])
 async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+    return await stream_json_array(db.status_checks.find().limit(1000), StatusCheck)
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -258,13 +475,49 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+class JSONGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that leaves raw background images alone; they're already compressed"""
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] == "http" and path.startswith("/api/backgrounds/") and path.endswith("/image"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+app.add_middleware(JSONGZipMiddleware, minimum_size=1024, compresslevel=5)
+
+async def create_unique_index(collection, field):
+    # Data written before these indexes existed may hold duplicates; serve without
+    # the index rather than failing startup, and leave the cleanup to an operator
+    try:
+        await collection.create_index(field, unique=True)
+    except OperationFailure:
+        logger.exception(
+            "Could not create unique index on %s.%s; run without it until duplicates are removed",
+            collection.name, field
+        )
+
+@app.on_event("startup")
+async def create_indexes():
+    # Point lookups; levels' unique index also serves the level_number sort
+    await create_unique_index(db.levels, "level_number")
+    await create_unique_index(db.progress, "player_id")
+    await create_unique_index(db.backgrounds, "id")
+    # Backfill the denormalized counter for documents written before it existed
+    await db.progress.update_many(
+        {"completed_count": {"$exists": False}},
+        [{"$set": {"completed_count": {"$size": {"$ifNull": ["$completed_levels", []]}}}}]
+    )
+    # Covers the leaderboard query: sort and projection are served from the index alone
+    await db.progress.create_index(
+        [("completed_count", -1), ("total_wins", -1), ("player_id", 1), ("total_attempts", 1)]
+    )
+
+@app.on_event("startup")
+async def start_leaderboard_refresh():
+    app.state.leaderboard_task = asyncio.create_task(refresh_leaderboard_loop())
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    app.state.leaderboard_task.cancel()
     client.close()
@@ -0,0 +1,28 @@
+import os
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+import pytest_asyncio
+from mongomock_motor import AsyncMongoMockClient
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+import server  # noqa: E402
+
+
+@pytest.fixture
+def db(monkeypatch):
+    mock_db = AsyncMongoMockClient()["test_database"]
+    monkeypatch.setattr(server, "db", mock_db)
+    return mock_db
+
+
+@pytest_asyncio.fixture
+async def api(db):
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
@@ -0,0 +1,66 @@
+import base64
+
+import pytest
+
+import server
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + b"\x00" * 4096
+PNG_B64 = base64.b64encode(PNG_BYTES).decode()
+
+
+@pytest.mark.asyncio
+async def test_save_and_fetch_background_image(api):
+    response = await api.post(
+        "/api/backgrounds",
+        json={"name": "kitchen", "image_data": f"data:image/png;base64,{PNG_B64}"},
+    )
+    assert response.status_code == 200
+    background_id = response.json()["id"]
+
+    response = await api.get(f"/api/backgrounds/{background_id}/image")
+
+    assert response.status_code == 200
+    assert response.content == PNG_BYTES
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["x-content-type-options"] == "nosniff"
+    # Already-compressed image formats are not gzipped again
+    assert "content-encoding" not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_large_json_responses_are_gzipped(api, db):
+    await db.status_checks.insert_many([
+        {"id": f"check-{i}", "client_name": "client", "timestamp": server.utcnow()}
+        for i in range(50)
+    ])
+
+    response = await api.get("/api/status", headers={"Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()) == 50
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("header", ["data:image/svg+xml;base64", "data:image;base64", "data:image"])
+async def test_save_background_rejects_unsupported_media_type(api, db, header):
+    response = await api.post(
+        "/api/backgrounds",
+        json={"name": "evil", "image_data": f"{header},{PNG_B64}"},
+    )
+
+    assert response.status_code == 400
+    assert await db.backgrounds.count_documents({}) == 0
+
+
+@pytest.mark.asyncio
+async def test_legacy_background_with_unsupported_media_type_is_not_served(api, db):
+    await db.backgrounds.insert_one({
+        "id": "legacy-svg",
+        "name": "legacy",
+        "image_data": f"data:image/svg+xml;base64,{PNG_B64}",
+    })
+
+    response = await api.get("/api/backgrounds/legacy-svg/image")
+
+    assert response.status_code == 404
@@ -0,0 +1,18 @@
+import pytest
+
+import server
+
+
+@pytest.mark.asyncio
+async def test_create_indexes_tolerates_existing_duplicates(db):
+    await db.levels.insert_many([
+        {"level_number": 1, "dispenser_x": 0, "dispenser_y": 0},
+        {"level_number": 1, "dispenser_x": 5, "dispenser_y": 5},
+    ])
+
+    await server.create_indexes()
+
+    level_indexes = await db.levels.index_information()
+    assert not any(index.get("unique") for index in level_indexes.values())
+    progress_indexes = await db.progress.index_information()
+    assert any(index.get("unique") for index in progress_indexes.values())
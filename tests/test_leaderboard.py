@@ -0,0 +1,93 @@
+import pytest
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def empty_leaderboard_cache():
+    server._lb_cache.clear()
+    yield
+    server._lb_cache.clear()
+
+
+def progress(player_id, completed_count, total_wins):
+    return {
+        "id": f"progress-{player_id}",
+        "player_id": player_id,
+        "current_level": 1,
+        "completed_levels": list(range(completed_count)),
+        "completed_count": completed_count,
+        "total_attempts": total_wins * 2,
+        "total_wins": total_wins,
+        "updated_at": server.utcnow(),
+    }
+
+
+def entry(player_id, completed_count, total_wins):
+    return {
+        "player_id": player_id,
+        "total_wins": total_wins,
+        "total_attempts": total_wins * 2,
+        "completed_count": completed_count,
+    }
+
+
+@pytest.mark.asyncio
+async def test_first_request_builds_the_snapshot(api, db):
+    await db.progress.insert_many([
+        progress("low", 1, 5),
+        progress("top", 3, 1),
+        progress("mid", 1, 9),
+    ])
+
+    response = await api.get("/api/leaderboard")
+
+    assert response.status_code == 200
+    assert [row["player_id"] for row in response.json()] == ["top", "mid", "low"]
+    snapshot = await db.leaderboard_top.find_one({"_id": "global"})
+    assert [row["player_id"] for row in snapshot["entries"]] == ["top", "mid", "low"]
+
+
+@pytest.mark.asyncio
+async def test_existing_snapshot_is_served_without_rescanning(api, db):
+    await db.progress.insert_one(progress("live", 9, 9))
+    await db.leaderboard_top.insert_one({"_id": "global", "entries": [entry("snapshot", 1, 1)]})
+
+    response = await api.get("/api/leaderboard")
+
+    assert response.status_code == 200
+    assert response.json() == [entry("snapshot", 1, 1)]
+
+
+@pytest.mark.asyncio
+async def test_limit_slices_the_snapshot(api, db):
+    entries = [entry(f"p{i}", 10 - i, 0) for i in range(5)]
+    await db.leaderboard_top.insert_one({"_id": "global", "entries": entries})
+
+    response = await api.get("/api/leaderboard", params={"limit": 2})
+
+    assert response.status_code == 200
+    assert response.json() == entries[:2]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("limit", [0, server.LEADERBOARD_SIZE + 1])
+async def test_limit_outside_snapshot_size_is_rejected(api, limit):
+    response = await api.get("/api/leaderboard", params={"limit": limit})
+
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_refresh_clears_cached_results(api, db):
+    await db.progress.insert_one(progress("first", 1, 1))
+    response = await api.get("/api/leaderboard")
+    assert [row["player_id"] for row in response.json()] == ["first"]
+    assert 10 in server._lb_cache
+
+    await db.progress.insert_one(progress("second", 5, 5))
+    await server.refresh_leaderboard()
+
+    assert len(server._lb_cache) == 0
+    response = await api.get("/api/leaderboard")
+    assert [row["player_id"] for row in response.json()] == ["second", "first"]
@@ -0,0 +1,31 @@
+import logging
+
+from fastapi.testclient import TestClient
+
+import server
+
+
+def test_logging_survives_repeated_lifespans(db, monkeypatch):
+    records = []
+    monkeypatch.setattr(server._log_handler, "emit", records.append)
+
+    for run in range(2):
+        with TestClient(server.app):
+            logging.getLogger("test").info("inside lifespan %d", run)
+        logging.getLogger("test").info("after lifespan %d", run)
+
+    server._log_queue.join()
+    assert [record.getMessage() for record in records] == [
+        "inside lifespan 0",
+        "after lifespan 0",
+        "inside lifespan 1",
+        "after lifespan 1",
+    ]
+
+
+def test_stop_log_listener_is_idempotent():
+    try:
+        server.stop_log_listener()
+        server.stop_log_listener()
+    finally:
+        server._log_listener.start()
@@ -0,0 +1,87 @@
+import pytest
+
+import server
+
+
+@pytest.mark.asyncio
+async def test_get_progress_creates_new_player(api, db):
+    response = await api.get("/api/progress/new-player")
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["player_id"] == "new-player"
+    assert body["current_level"] == 1
+    assert body["completed_levels"] == []
+    assert body["completed_count"] == 0
+    assert await db.progress.count_documents({"player_id": "new-player"}) == 1
+
+
+@pytest.mark.asyncio
+async def test_get_progress_returns_existing_player(api, db):
+    await db.progress.insert_one({
+        "id": "progress-1",
+        "player_id": "existing",
+        "current_level": 4,
+        "completed_levels": [1, 2, 3],
+        "completed_count": 3,
+        "total_attempts": 9,
+        "total_wins": 3,
+        "updated_at": server.utcnow(),
+    })
+
+    response = await api.get("/api/progress/existing")
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["id"] == "progress-1"
+    assert body["current_level"] == 4
+    assert body["completed_levels"] == [1, 2, 3]
+    assert await db.progress.count_documents({"player_id": "existing"}) == 1
+
+
+@pytest.mark.asyncio
+async def test_update_progress_counts_each_level_once(api, db):
+    for _ in range(2):
+        response = await api.put("/api/progress/p1", json={"completed_level": 3})
+        assert response.status_code == 200
+
+    body = response.json()
+    assert body["completed_levels"] == [3]
+    assert body["completed_count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_update_progress_keeps_level_when_player_created_concurrently(api, db, monkeypatch):
+    collection_cls = type(db.progress)
+    real_find_one_and_update = collection_cls.find_one_and_update
+    calls = []
+
+    async def find_one_and_update(self, *args, **kwargs):
+        result = await real_find_one_and_update(self, *args, **kwargs)
+        if not calls:
+            # Another request creates the player right after the conditional push missed
+            await db.progress.insert_one({
+                "id": "concurrent",
+                "player_id": "racer",
+                "current_level": 1,
+                "completed_levels": [],
+                "completed_count": 0,
+                "total_attempts": 1,
+                "total_wins": 0,
+                "updated_at": server.utcnow(),
+            })
+        calls.append(args)
+        return result
+
+    monkeypatch.setattr(collection_cls, "find_one_and_update", find_one_and_update)
+
+    response = await api.put("/api/progress/racer", json={"completed_level": 2, "add_win": True})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["completed_levels"] == [2]
+    assert body["completed_count"] == 1
+    assert body["total_wins"] == 1
+    stored = await db.progress.find_one({"player_id": "racer"})
+    assert stored["completed_levels"] == [2]
+    assert stored["completed_count"] == 1
@@ -0,0 +1,74 @@
+import logging
+
+import httpx
+import pytest
+import pytest_asyncio
+from bson import ObjectId
+from pymongo.errors import AutoReconnect
+
+import server
+
+
+@pytest_asyncio.fixture
+async def api_500(db):
+    # Report unhandled errors as a 500 response, as a server would, instead of raising
+    transport = httpx.ASGITransport(app=server.app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+def status_check(client_name):
+    return {"id": str(ObjectId()), "client_name": client_name, "timestamp": server.utcnow()}
+
+
+@pytest.mark.asyncio
+async def test_streamed_list_with_no_documents(api):
+    response = await api.get("/api/status")
+
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+@pytest.mark.asyncio
+async def test_streamed_list_returns_every_document(api, db):
+    await db.status_checks.insert_many([status_check("a"), status_check("b")])
+
+    response = await api.get("/api/status")
+
+    assert response.status_code == 200
+    assert [check["client_name"] for check in response.json()] == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_failure_on_first_document_is_a_500(api_500, db):
+    await db.status_checks.insert_one(status_check(ObjectId()))
+
+    response = await api_500.get("/api/status")
+
+    assert response.status_code == 500
+
+
+class FailingCursor:
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        raise AutoReconnect("connection lost")
+
+
+@pytest.mark.asyncio
+async def test_query_failure_surfaces_before_the_response_starts():
+    with pytest.raises(AutoReconnect):
+        await server.stream_json_array(FailingCursor(), server.StatusCheck)
+
+
+@pytest.mark.asyncio
+async def test_failure_mid_stream_is_logged_and_aborts(api_500, db, caplog):
+    await db.status_checks.insert_many([status_check("ok"), status_check(ObjectId())])
+
+    with caplog.at_level(logging.ERROR, logger=server.logger.name):
+        response = await api_500.get("/api/status")
+
+    assert "Aborting streamed StatusCheck list" in caplog.text
+    # The array is never closed, so the truncated body can't be mistaken for a full list
+    assert not response.content.endswith(b"]")